@@ -0,0 +1,11 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class Diagnostic:
+    """ Error found in the source, `start` and `end` are offsets of the offending token """
+    message: str
+    start: int
+    end: int
+    line: int
+    column: int
@@ -1,6 +1,8 @@
 """ SCI - Simple C Interpreter """
+from .diagnostic import Diagnostic
 from .keywords import *
 from .lexer_token import Token
+from .position import LineIndex
 
 RESERVED_KEYWORDS = {
     'def': Token(DEF_FUC, 'def'),
@@ -34,8 +36,18 @@ class Lexer:
     def __init__(self, text):
         self.text = text.replace('\\n', '\n')
         self.pos = 0
-        self.current_char = self.text[self.pos]
-        self.line = 1
+        self.current_char = self.text[self.pos] if self.text else None  # None indicates end of input
+        self.lines = LineIndex(self.text)
+        # offset where the token being scanned starts
+        self.start = 0
+        # when set, errors are collected into `diagnostics` and scanning goes on
+        self.recover = False
+        self.diagnostics = []
+
+    @property
+    def line(self):
+        """ Line of the current char """
+        return self.lines.line(self.pos)
 
     def error(self, message):
         raise LexicalError(message)
@@ -57,17 +69,14 @@ class Lexer:
             return self.text[peek_pos]
 
     def skip_whitespace(self):
-        """ Skip all whitespaces between tokens from input """
-        while self.current_char is not None and self.current_char.isspace():
-            if self.current_char == '\n':
-                self.line += 1
+        """ Skip all whitespaces between tokens from input, new lines are kept as `EOL` tokens """
+        while self.current_char is not None and self.current_char != '\n' and self.current_char.isspace():
             self.make_step()
 
     def skip_comment(self):
         """ Skip single line comment """
         while self.current_char is not None:
             if self.current_char == '\n':
-                self.line += 1
                 self.make_step()
                 return
             self.make_step()
@@ -97,7 +106,7 @@ class Lexer:
         while self.current_char is not '"':
             if self.current_char is None:
                 self.error(
-                    message='Unfinished string with \'"\' at line {}'.format(self.line)
+                    message='Unfinished string with \'"\' at line {}'.format(self.lines.line(self.start))
                 )
             result += self.current_char
             self.make_step()
@@ -110,7 +119,7 @@ class Lexer:
         char = self.current_char
         self.make_step()
         if self.current_char != '\'':
-            self.error("Unclosed char constant at line {}".format(self.line))
+            self.error("Unclosed char constant at line {}".format(self.lines.line(self.start)))
         self.make_step()
         return Token(CHAR_CONST, ord(char))
 
@@ -121,19 +130,40 @@ class Lexer:
             result += self.current_char
             self.make_step()
 
-        token = RESERVED_KEYWORDS.get(result, Token(ID, result))
-        return token
+        keyword = RESERVED_KEYWORDS.get(result)
+        if keyword is not None:
+            return Token(keyword.type, keyword.value)
+        return Token(ID, result)
 
     @property
     def get_next_token(self):
         """ Lexical analyzer (also known as scanner or tokenizer)
         This method is responsible for breaking a sentence
         apart into tokens. One token at a time. """
+        while True:
+            try:
+                token = self.scan()
+                break
+            except LexicalError as error:
+                if not self.recover:
+                    raise
+                # the parser may rewind the lexer, errors are reported once
+                if not self.diagnostics or self.diagnostics[-1].start < self.start:
+                    self.diagnostics.append(Diagnostic(
+                        str(error), self.start, max(self.pos, self.start + 1), *self.lines.position(self.start)
+                    ))
+                # skip the invalid char
+                if self.pos == self.start:
+                    self.make_step()
+        token.start = self.start
+        token.end = self.pos
+        return token
 
+    def scan(self):
         while self.current_char is not None:
+            self.start = self.pos
 
             if self.current_char == '\n':
-                self.line += 1
                 self.make_step()
                 return Token(EOL, '\n')
 
@@ -257,6 +287,7 @@ class Lexer:
                 message="Invalid char {} at line {}".format(self.current_char, self.line)
             )
 
+        self.start = self.pos
         return Token(EOF, None)
 
     def __next__(self):
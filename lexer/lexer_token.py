@@ -9,6 +9,9 @@ class Token:
     Output from Lexical analysis is list of tokens"""
     type: str
     value: Union[int, str, float, bool]
+    # offsets of the first and past-the-last char of the token in the source
+    start: int = None
+    end: int = None
 
     def __eq__(self, other: str):
         return self.type == other
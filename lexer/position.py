@@ -0,0 +1,22 @@
+from bisect import bisect_right
+
+
+class LineIndex:
+    """ Offsets of the line starts in the text.
+    Maps offset in the text to line and column with binary search. """
+
+    def __init__(self, text):
+        self.starts = [0]
+        pos = text.find('\n')
+        while pos != -1:
+            self.starts.append(pos + 1)
+            pos = text.find('\n', pos + 1)
+
+    def line(self, offset):
+        """ 1-based line of the char at offset """
+        return bisect_right(self.starts, offset)
+
+    def position(self, offset):
+        """ 1-based line and column of the char at offset """
+        line = self.line(offset)
+        return line, offset - self.starts[line - 1] + 1
@@ -0,0 +1,313 @@
+""" Columnar binary encoding of tokens for `multiprocessing.shared_memory`
+
+A block is a header followed by fixed-width sections (arrays of one
+typecode each) and a string table. Other processes attach to the block
+by name and read tokens through lightweight views, nothing is unpickled.
+"""
+import struct
+import sys
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+
+from .lexer_token import Token
+
+HEADER = struct.Struct('<4sI')  # block kind, number of sections
+SECTION = struct.Struct('<QQ')  # offset, size in bytes
+ALIGNMENT = 8
+
+# kinds of token values, stored in the `kinds` column
+# ints which don't fit into 8 bytes are kept as decimal strings (BIG_INT)
+NONE, INT, FLOAT, STR, BOOL, BIG_INT = range(6)
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class SharedBlockError(Exception): ...
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _layout(sections):
+    """ Return offsets of the sections and the total size of the block """
+    offset = HEADER.size + SECTION.size * len(sections)
+    offsets = []
+    for data in sections:
+        offset = _align(offset)
+        offsets.append(offset)
+        offset += len(memoryview(data).cast('B'))
+    return offsets, max(offset, 1)
+
+
+def _write_sections(buf, kind, sections, offsets):
+    HEADER.pack_into(buf, 0, kind, len(sections))
+    for i, (data, offset) in enumerate(zip(sections, offsets)):
+        raw = memoryview(data).cast('B')
+        SECTION.pack_into(buf, HEADER.size + SECTION.size * i, offset, len(raw))
+        buf[offset:offset + len(raw)] = raw
+
+
+def _read_sections(buf, kind):
+    """ Return raw byte views of all sections stored in the block """
+    found, count = HEADER.unpack_from(buf, 0)
+    if found != kind:
+        raise SharedBlockError('Expected block of kind {} but found {}'.format(kind, found))
+    sections = []
+    for i in range(count):
+        offset, size = SECTION.unpack_from(buf, HEADER.size + SECTION.size * i)
+        sections.append(buf[offset:offset + size])
+    return sections
+
+
+class StringTable:
+    """ Interned strings, stored as utf-8 blob plus end offsets """
+
+    def __init__(self):
+        self.index = {}
+        self.ends = array('Q')
+        self.blob = bytearray()
+
+    def add(self, value: str) -> int:
+        idx = self.index.get(value)
+        if idx is None:
+            idx = self.index[value] = len(self.ends)
+            self.blob += value.encode('utf-8')
+            self.ends.append(len(self.blob))
+        return idx
+
+    def sections(self):
+        return [self.ends, self.blob]
+
+
+class StringTableView:
+    """ Read-only access to a string table placed in shared memory """
+
+    def __init__(self, ends, blob):
+        self.ends = ends
+        self.blob = blob
+        self.cache = {}
+
+    def __getitem__(self, idx):
+        value = self.cache.get(idx)
+        if value is None:
+            start = self.ends[idx - 1] if idx else 0
+            value = self.cache[idx] = str(self.blob[start:self.ends[idx]], 'utf-8')
+        return value
+
+    def __len__(self):
+        return len(self.ends)
+
+
+class TokenColumns:
+    """ Builder of the token columns: type, kind of value, 8 byte payload
+    and source offsets. Strings (including token types) are kept in the shared
+    string table, floats are stored bit-for-bit in the payload column. """
+
+    def __init__(self, strings: StringTable):
+        self.strings = strings
+        self.types = array('I')
+        self.kinds = array('B')
+        self.payload = array('q')
+        self.starts = array('q')
+        self.ends = array('q')
+
+    def add(self, token: Token) -> int:
+        value = token.value
+        if value is None:
+            kind, payload = NONE, 0
+        elif isinstance(value, bool):
+            kind, payload = BOOL, int(value)
+        elif isinstance(value, int):
+            if INT_MIN <= value <= INT_MAX:
+                kind, payload = INT, value
+            else:
+                kind, payload = BIG_INT, self.strings.add(str(value))
+        elif isinstance(value, float):
+            kind, payload = FLOAT, struct.unpack('<q', struct.pack('<d', value))[0]
+        else:
+            kind, payload = STR, self.strings.add(str(value))
+
+        self.types.append(self.strings.add(token.type))
+        self.kinds.append(kind)
+        self.payload.append(payload)
+        self.starts.append(-1 if token.start is None else token.start)
+        self.ends.append(-1 if token.end is None else token.end)
+        return len(self.types) - 1
+
+    def sections(self):
+        return [self.types, self.kinds, self.payload, self.starts, self.ends]
+
+
+class TokenColumnsView:
+    """ Read-only access to token columns placed in shared memory """
+
+    def __init__(self, strings, types, kinds, payload, starts, ends):
+        self.strings = strings
+        self.types = types.cast('I')
+        self.kinds = kinds.cast('B')
+        self.ints = payload.cast('q')
+        self.floats = payload.cast('d')
+        self.starts = starts.cast('q')
+        self.ends = ends.cast('q')
+
+    def type(self, idx):
+        return self.strings[self.types[idx]]
+
+    def value(self, idx):
+        kind = self.kinds[idx]
+        if kind == INT:
+            return self.ints[idx]
+        if kind == STR:
+            return self.strings[self.ints[idx]]
+        if kind == FLOAT:
+            return self.floats[idx]
+        if kind == BOOL:
+            return bool(self.ints[idx])
+        if kind == BIG_INT:
+            return int(self.strings[self.ints[idx]])
+        return None
+
+    def offset(self, offsets, idx):
+        offset = offsets[idx]
+        return None if offset < 0 else offset
+
+    def views(self):
+        return [self.types, self.kinds, self.ints, self.floats, self.starts, self.ends]
+
+    def __len__(self):
+        return len(self.types)
+
+
+class TokenView:
+    """ Token-like view of a single encoded token """
+    __slots__ = ('columns', 'index')
+
+    def __init__(self, columns: TokenColumnsView, index: int):
+        self.columns = columns
+        self.index = index
+
+    @property
+    def type(self):
+        return self.columns.type(self.index)
+
+    @property
+    def value(self):
+        return self.columns.value(self.index)
+
+    @property
+    def start(self):
+        return self.columns.offset(self.columns.starts, self.index)
+
+    @property
+    def end(self):
+        return self.columns.offset(self.columns.ends, self.index)
+
+    def to_token(self):
+        return Token(self.type, self.value, self.start, self.end)
+
+    def __eq__(self, other: str):
+        return self.type == other
+
+    def __repr__(self):
+        return 'TokenView(type={!r}, value={!r})'.format(self.type, self.value)
+
+
+class SharedBlock:
+    """ Base class of the blocks living in a shared memory segment.
+    The process which creates the block owns it and unlinks the segment
+    on `close`, attached processes only detach from it. """
+    KIND = b''
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self.buf = shm.buf.toreadonly()
+        try:
+            self.raw = _read_sections(self.buf, self.KIND)
+        except SharedBlockError:
+            self.buf.release()
+            shm.close()
+            raise
+        self.setup()
+
+    def setup(self):
+        """ Create typed views over `self.raw` sections """
+        raise NotImplementedError
+
+    def views(self):
+        """ Typed memoryviews created in `setup`, released on `close` """
+        return []
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @classmethod
+    def create(cls, sections):
+        offsets, size = _layout(sections)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        _write_sections(shm.buf, cls.KIND, sections, offsets)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """ Open block created by another process """
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+            # before python 3.13 attaching registers the segment in the
+            # resource tracker, which would unlink it when this process exits
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm)
+
+    def close(self):
+        for view in self.views() + self.raw:
+            view.release()
+        self.buf.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TokenBlock(SharedBlock):
+    """ Token stream in shared memory
+
+    >>> with TokenBlock.from_tokens(Lexer(text)) as block:
+    ...     worker(block.name)  # TokenBlock.attach(name) in the worker
+    """
+    KIND = b'TPYT'
+
+    @classmethod
+    def from_tokens(cls, tokens):
+        strings = StringTable()
+        columns = TokenColumns(strings)
+        for token in tokens:
+            columns.add(token)
+        return cls.create(strings.sections() + columns.sections())
+
+    def setup(self):
+        ends, blob, *columns = self.raw
+        self.strings = StringTableView(ends.cast('Q'), blob)
+        self.columns = TokenColumnsView(self.strings, *columns)
+
+    def views(self):
+        return [self.strings.ends] + self.columns.views()
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < len(self):
+            raise IndexError('Token index {} out of range'.format(idx))
+        return TokenView(self.columns, idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield TokenView(self.columns, idx)
@@ -0,0 +1,118 @@
+""" Compile-time bounds checking of array accesses
+
+Accesses to fixed-size arrays with a constant index are checked once
+here and marked with `Index.checked`, so the runtime can skip the check.
+The same is done for accesses indexed by the variable of a counting
+`for` loop with constant bounds: the check of the whole loop range is
+hoisted to compile time.
+"""
+from lexer.keywords import ADD_OP, LE_OP, LT_OP
+from .tree import *
+from .utils import walk
+
+
+class BoundsError(Exception): ...
+
+
+def _fixed_sizes(nodes):
+    """ Map names of fixed-size arrays declared by the nodes to their sizes.
+    Sizes of params aren't trusted, callers may pass arrays of any size. """
+    sizes = {}
+    for node in nodes:
+        if isinstance(node, VarDecl) and isinstance(node.type_node, ArrayType) \
+                and node.type_node.size is not None and isinstance(node.var_node, Var):
+            sizes[node.var_node.token.value] = node.type_node.size
+    return sizes
+
+
+def _int_constant(node):
+    if isinstance(node, Num) and isinstance(node.value, int) and not isinstance(node.value, bool):
+        return node.value
+    return None
+
+
+def _is_var(node, name):
+    return isinstance(node, Var) and node.token.value == name
+
+
+def _loop_range(loop: ForStmt):
+    """ Return (name, first, last) values of the loop variable when the loop is
+    `for i = <const>; i < <const>; i = i + <positive const>` and its body
+    doesn't assign the variable, None otherwise. """
+    setup = loop.setup
+    if isinstance(setup, VarDecl) and isinstance(setup.var_node, Var):
+        name, first = setup.var_node.token.value, _int_constant(setup.value)
+    elif isinstance(setup, Assign) and isinstance(setup.left, Var):
+        name, first = setup.left.token.value, _int_constant(setup.right)
+    else:
+        return None
+
+    condition = loop.condition
+    if first is None or not isinstance(condition, BinOp) or not _is_var(condition.left, name) \
+            or condition.op.type not in (LT_OP, LE_OP):
+        return None
+    limit = _int_constant(condition.right)
+    if limit is None:
+        return None
+    last = limit - 1 if condition.op.type == LT_OP else limit
+
+    increment = loop.increment
+    if not isinstance(increment, Assign) or not _is_var(increment.left, name) \
+            or not isinstance(increment.right, BinOp) or increment.right.op.type != ADD_OP \
+            or not _is_var(increment.right.left, name) or (_int_constant(increment.right.right) or 0) <= 0:
+        return None
+
+    for node in walk(loop.body):
+        if isinstance(node, Assign) and _is_var(node.left, name) \
+                or isinstance(node, VarDecl) and _is_var(node.var_node, name):
+            return None
+    return name, first, last
+
+
+def check_bounds(program: Program):
+    """ Check constant indexes and loop-variable indexes of fixed-size arrays
+    and mark them as checked. Raise `BoundsError` when constant index is out of bounds.
+    Returns number of accesses which don't need runtime check. """
+    checked = 0
+    global_sizes = _fixed_sizes(program.declarations)
+
+    for declaration in program.declarations:
+        sizes = dict(global_sizes)
+        if isinstance(declaration, FunctionDecl):
+            scope = list(declaration.params) + list(walk(declaration.body))
+            # array redeclared without static size shadows the global one
+            for node in scope:
+                if isinstance(node, (VarDecl, Param)) and isinstance(node.var_node, Var):
+                    sizes.pop(node.var_node.token.value, None)
+            sizes.update(_fixed_sizes(scope))
+
+        for node in walk(declaration):
+            if not isinstance(node, Index) or not isinstance(node.value, Var) \
+                    or not isinstance(node.index, Num) or not isinstance(node.index.value, int):
+                continue
+            size = sizes.get(node.value.token.value)
+            if size is None:
+                continue
+            if not 0 <= node.index.value < size:
+                raise BoundsError('Index {} out of range for array {} of size {} at line {}'.format(
+                    node.index.value, node.value.token.value, size, node.line
+                ))
+            node.checked = True
+            checked += 1
+
+        for loop in walk(declaration):
+            loop_range = _loop_range(loop) if isinstance(loop, ForStmt) else None
+            if loop_range is None:
+                continue
+            name, first, last = loop_range
+            if first > last:
+                continue
+            for node in walk(loop.body):
+                if isinstance(node, Index) and not node.checked and isinstance(node.value, Var) \
+                        and _is_var(node.index, name):
+                    size = sizes.get(node.value.token.value)
+                    # out of range loops are left to the runtime check
+                    if size is not None and 0 <= first and last < size:
+                        node.checked = True
+                        checked += 1
+    return checked
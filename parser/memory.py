@@ -0,0 +1,197 @@
+""" Memory accounting and budget enforcement of the compiler pipeline
+
+Allocations are traced with `tracemalloc` per stage (lexer, parser and
+later passes). When a budget is set, memory traced since the start of the
+compilation is checked on every token, so a huge input aborts with
+`MemoryBudgetError` before it uses up the host's memory. Tracing slows the
+compiler down several times, so without a budget it is off unless asked for.
+"""
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import List
+
+from lexer.keywords import EOF
+from lexer.lexer import Lexer
+from lexer.lexer_token import Token
+from .parser import Parser
+from .utils import walk
+
+
+class MemoryBudgetError(Exception):
+    def __init__(self, stage, used, budget):
+        super().__init__('Stage {} used {} bytes, over the budget of {} bytes'.format(stage, used, budget))
+        self.stage = stage
+        self.used = used
+        self.budget = budget
+
+
+@dataclass
+class StageUsage:
+    name: str
+    # bytes still allocated when the stage finished, relative to its start
+    allocated: int = 0
+    # highest traced memory during the stage, relative to its start
+    peak: int = 0
+    # highest traced memory during the stage, relative to the start of compilation
+    total_peak: int = 0
+
+
+@dataclass
+class MemoryReport:
+    stages: List[StageUsage] = field(default_factory=list)
+    tokens: int = 0
+    token_bytes: int = 0
+    nodes: int = 0
+    node_bytes: int = 0
+    # line start offsets kept by the lexer
+    cache_bytes: int = 0
+
+    @property
+    def peak(self):
+        """ Highest memory used by the compilation """
+        return max((stage.total_peak for stage in self.stages), default=0)
+
+    @property
+    def dominant_stage(self):
+        """ Stage which added the most memory on top of what earlier stages hold """
+        stage = max(self.stages, key=lambda stage: stage.peak, default=None)
+        # None when the stages weren't traced
+        return stage.name if stage is not None and stage.peak else None
+
+    def __str__(self):
+        lines = ['{:<24} {:>14} {:>14} {:>14}'.format('stage', 'allocated', 'peak', 'total peak')]
+        for stage in self.stages:
+            lines.append('{:<24} {:>14} {:>14} {:>14}'.format(
+                stage.name, stage.allocated, stage.peak, stage.total_peak
+            ))
+        lines.append('tokens: {} ({} bytes), nodes: {} ({} bytes), caches: {} bytes'.format(
+            self.tokens, self.token_bytes, self.nodes, self.node_bytes, self.cache_bytes
+        ))
+        lines.append('peak: {} bytes, dominated by {}'.format(self.peak, self.dominant_stage))
+        return '\n'.join(lines)
+
+
+def _object_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+class MemoryAccount:
+    """ Traces memory used by one compilation
+
+    >>> with MemoryAccount(budget=64 * 2 ** 20) as account:
+    ...     with account.stage('Lexer'):
+    ...         tokens = list(Lexer(text))
+    >>> print(account.report)
+    """
+
+    def __init__(self, budget=None, trace=True):
+        self.budget = budget
+        self.trace = trace or budget is not None
+        self.report = MemoryReport()
+        self.current = None
+        self.baseline = 0
+        self.stage_start = 0
+        self.started = False
+
+    def __enter__(self):
+        if not self.trace:
+            return self
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+        self.baseline = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc):
+        if self.started:
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name):
+        """ Account allocations made inside the block to the stage """
+        self.current = StageUsage(name)
+        self.report.stages.append(self.current)
+        if not self.trace:
+            yield self
+            return
+        tracemalloc.reset_peak()
+        self.stage_start = tracemalloc.get_traced_memory()[0]
+        try:
+            yield self
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            self.current.allocated = current - self.stage_start
+            self.current.peak = max(peak - self.stage_start, 0)
+            self.current.total_peak = max(peak - self.baseline, 0)
+        # passes can't be interrupted, so they are checked when finished
+        self.check()
+
+    def check(self):
+        """ Raise `MemoryBudgetError` when traced memory is over the budget """
+        if self.budget is not None:
+            used = tracemalloc.get_traced_memory()[0] - self.baseline
+            if used > self.budget:
+                raise MemoryBudgetError(self.current.name if self.current else None, used, self.budget)
+
+
+class TokenStream:
+    """ Feeds scanned tokens to the `Parser` in place of the `Lexer`,
+    `check` is called for every token when set """
+
+    def __init__(self, tokens, lines, check=None):
+        self.tokens = tokens
+        self.lines = lines
+        self.check = check
+        self.index = 0
+        end = tokens[-1].end if tokens else 0
+        self.eof = Token(EOF, None, end, end)
+
+    @property
+    def get_next_token(self):
+        if self.check is not None:
+            self.check()
+        if self.index >= len(self.tokens):
+            return self.eof
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+
+def compile_source(text, budget=None, passes=(), trace=False):
+    """ Lex and parse the text and run `passes` (callables taking the `Program`)
+    under the memory budget in bytes. Returns the program and `MemoryReport`,
+    stages are traced only with a budget or `trace`. """
+    with MemoryAccount(budget, trace) as account:
+        # without a budget there is nothing to check on every token
+        check = account.check if budget is not None else None
+
+        with account.stage('Lexer'):
+            lexer = Lexer(text)
+            if check is None:
+                tokens = list(lexer)
+            else:
+                tokens = []
+                for token in lexer:
+                    tokens.append(token)
+                    check()
+
+        with account.stage('Parser'):
+            program = Parser(TokenStream(tokens, lexer.lines, check)).parse()
+
+        for compiler_pass in passes:
+            with account.stage(getattr(compiler_pass, '__name__', type(compiler_pass).__name__)):
+                compiler_pass(program)
+
+        report = account.report
+        report.tokens = len(tokens)
+        report.token_bytes = sum(_object_size(token) for token in tokens)
+        nodes = list(walk(program))
+        report.nodes = len(nodes)
+        report.node_bytes = sum(_object_size(node) for node in nodes)
+        report.cache_bytes = sys.getsizeof(lexer.lines.starts)
+    return program, report
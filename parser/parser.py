@@ -1,20 +1,73 @@
 from .tree import *
 from .utils import *
-from ..lexer.keywords import *
+from lexer.diagnostic import Diagnostic
+from lexer.keywords import *
 
 BIN_OP = (ADD_OP, SUB_OP, MUL_OP, DIV_OP, POWER_OP, MOD_OP, AND_OP, OR_OP, GE_OP, GT_OP, LE_OP, LT_OP, EQ_OP, NE_OP)
+CONSTANTS = (INTEGER_CONST, FLOAT_CONST, CHAR_CONST, STRING, TRUE, FALSE)
 
 
 class SyntaxError(Exception): ...
 
 
 class Parser:
-    def __init__(self, lexer):
+    def __init__(self, lexer, recover=False):
+        """ With `recover` set, syntax errors don't stop parsing: they are
+        collected into `diagnostics` and the parser skips to the next line,
+        `end` or `def`, so `parse` returns partial program. """
         self.lexer = lexer
+        self.recover = recover
+        self.errors = []
+        self.blocks = 0  # number of blocks being parsed
+        if recover:
+            self.lexer.recover = True
         self.current_token = self.lexer.get_next_token  # set current token to the first token taken from the input
+        self.previous_token = None  # last eaten token, ends the node being built
 
     def error(self, message):
-        raise SyntaxError(message)
+        error = SyntaxError(message)
+        error.token = self.current_token
+        raise error
+
+    @property
+    def diagnostics(self):
+        """ Lexical and syntax errors found so far, ordered by position """
+        return sorted(getattr(self.lexer, 'diagnostics', []) + self.errors, key=lambda d: d.start)
+
+    def report(self, message, token):
+        self.errors.append(Diagnostic(
+            message, token.start, max(token.end, token.start), *self.lexer.lines.position(token.start)
+        ))
+
+    def synchronize(self):
+        """ Skip tokens until the end of line, `end` of the current block or `def`.
+        Nested blocks met on the way are skipped as a whole. """
+        depth = 0
+        while self.current_token.type != EOF:
+            token_type = self.current_token.type
+            if depth == 0:
+                if token_type == EOL:
+                    self.eat(EOL)
+                    return
+                if token_type == DEF_FUC:
+                    return
+                if token_type == END:
+                    # stray `end` outside of any block is skipped
+                    if self.blocks == 0:
+                        self.eat(END)
+                    return
+            if token_type == BEGIN:
+                depth += 1
+            elif token_type == END:
+                depth -= 1
+            self.eat(token_type)
+
+    def recovered(self, error):
+        """ Record the error and resynchronize, re-raise when not recovering """
+        if not self.recover:
+            raise error
+        self.report(str(error), error.token)
+        self.synchronize()
 
     def eat(self, token_type):
         """ Compare the current token type with the passed token
@@ -23,99 +76,175 @@ class Parser:
         otherwise raise an exception. """
 
         if self.current_token.type == token_type:
+            self.previous_token = self.current_token
             self.current_token = self.lexer.get_next_token
         else:
             self.error(
                 'Expected token <{}> but found <{}> at line {}.'.format(
-                    token_type, self.current_token.type, self.lexer.line
+                    token_type, self.current_token.type, self.lexer.lines.line(self.current_token.start)
                 )
             )
 
+    def span(self, first):
+        """ Position of the node from the `first` token to the last eaten one """
+        end = self.previous_token.end if self.previous_token is not None else first.start
+        return dict(
+            line=self.lexer.lines.line(first.start),
+            start=first.start,
+            end=max(end, first.start),
+        )
+
     def program(self):
+        first = self.current_token
+        declarations = self.declarations()
+        while self.recover and self.current_token.type != EOF:
+            token = self.current_token
+            self.report('Expected declaration but found <{}> at line {}.'.format(
+                token.type, self.lexer.lines.line(token.start)
+            ), token)
+            self.synchronize()
+            declarations.extend(self.declarations())
         root = Program(
-            declarations=self.declarations(),
-            line=self.lexer.line
+            declarations=declarations,
+            **self.span(first)
         )
         return root
 
     def declarations(self):
         declarations = []
 
-        while self.current_token.type in (DEF_FUC, ID):
-            if self.current_token.type == ID:
-                declarations.extend(self.declaration())
-            elif self.current_token.type == DEF_FUC:
-                declarations.append(self.function_declaration())
+        while self.current_token.type in (DEF_FUC, EOL) or self.check_declaration():
+            try:
+                if self.current_token.type == EOL:
+                    self.eat(EOL)
+                elif self.current_token.type == ID:
+                    declarations.append(self.declaration())
+                elif self.current_token.type == DEF_FUC:
+                    function = self.function_declaration()
+                    if function is not None:
+                        declarations.append(function)
+            except SyntaxError as error:
+                self.recovered(error)
         return declarations
 
+    @restorable
+    def check_declaration(self):
+        if self.current_token.type == ID:
+            self.eat(ID)
+            return self.current_token == COLON
+        return False
+
     def declaration(self):
+        first = self.current_token
         variable = self.variable()
         self.eat(COLON)
         type_node = self.type_spec()
+        expression = None
         if self.current_token == ASSIGN:
             self.eat(ASSIGN)
-        expression = self.expression()
+            expression = self.expression()
 
         return VarDecl(
             var_node=variable,
             type_node=type_node,
-            line=self.lexer.line,
             value=expression,
+            **self.span(first)
         )
 
     def function_declaration(self):
+        """ In recover mode errors in the header are recorded and the body is
+        still parsed, returns None when the header has no `begin` or name """
+        first = self.current_token
         self.eat(DEF_FUC)
-        func_name = self.current_token.value
-        self.eat(LPAREN)
-        params = self.arg_list()
-        self.eat(RPAREN)
-        self.eat(RETURN_FUNC)
-        type_node = self.type_spec()
+        func_name, params, type_node = None, [], None
+        try:
+            name = self.current_token
+            self.eat(ID)
+            func_name = name.value
+            self.eat(LPAREN)
+            params = self.arg_list()
+            self.eat(RPAREN)
+            self.eat(RETURN_FUNC)
+            type_node = self.type_spec()
+            self.eat(COLON)
+        except SyntaxError as error:
+            if not self.recover:
+                raise
+            self.report(str(error), error.token)
+            # skip the rest of the header, so errors of the body are reported too
+            while self.current_token.type not in (BEGIN, EOL, DEF_FUC, EOF):
+                self.eat(self.current_token.type)
+            if self.current_token.type != BEGIN:
+                return None
+        body = self.block()
+        if func_name is None:
+            return None
         return FunctionDecl(
             type_node=type_node,
             func_name=func_name,
             params=params,
-            body=self.block(),
-            line=self.lexer.line
+            body=body,
+            **self.span(first)
         )
 
     def block(self):
         result = []
 
+        first = self.current_token
         self.eat(BEGIN)
-        while self.current_token.type != END:
-            # declaration
-            if self.current_token.type in (ID, DEF_FUC):
-                result.extend(self.declarations())
-            # statements
-            elif self.current_token.type in (IF, FOR, WHILE, RETURN):
-                result.extend(self.statement())
-            else:
-                result.append(self.expression())
-        self.eat(END)
+        self.blocks += 1
+        try:
+            while self.current_token.type not in (END, EOF):
+                try:
+                    if self.current_token.type == EOL:
+                        self.eat(EOL)
+                    # declaration
+                    elif self.current_token.type == DEF_FUC or self.check_declaration():
+                        result.extend(self.declarations())
+                    # statements
+                    elif self.current_token.type in (IF, FOR, WHILE, RETURN, BREAK, CONTINUE):
+                        result.append(self.statement())
+                    else:
+                        result.append(self.expression())
+                except SyntaxError as error:
+                    self.recovered(error)
+        finally:
+            self.blocks -= 1
+
+        if self.recover and self.current_token.type == EOF:
+            # keep the unfinished block in the partial program
+            self.report('Expected token <END> but found <EOF> at line {}.'.format(
+                self.lexer.lines.line(self.current_token.start)
+            ), self.current_token)
+        else:
+            self.eat(END)
         return FunctionBody(
             children=result,
-            line=self.lexer.line
+            **self.span(first)
         )
 
     def arg_list(self):
         nodes = []
         if self.current_token.type != RPAREN:
+            first = self.current_token
             identifier = self.variable()
+            self.eat(COLON)
             type_spec = self.type_spec()
             nodes = [Param(
                 type_node=type_spec,
                 var_node=identifier,
-                line=self.lexer.line
+                **self.span(first)
             )]
             while self.current_token.type == COMMA:
                 self.eat(COMMA)
+                first = self.current_token
                 identifier = self.variable()
+                self.eat(COLON)
                 type_spec = self.type_spec()
                 nodes.append(Param(
                     type_node=type_spec,
                     var_node=identifier,
-                    line=self.lexer.line
+                    **self.span(first)
                 ))
         return nodes
 
@@ -123,6 +252,7 @@ class Parser:
         """
         init_declarator             : variable (ASSIGN assignment_expression)?
         """
+        first = self.current_token
         var = self.variable()
         result = list()
         result.append(var)
@@ -133,11 +263,12 @@ class Parser:
                 left=var,
                 op=token,
                 right=self.assignment_expression(),
-                line=self.lexer.line
+                **self.span(first)
             ))
         return result
 
     def statement(self):
+        first = self.current_token
         if self.current_token.type == FOR:
             return self.for_statement()
         elif self.current_token.type == IF:
@@ -147,18 +278,19 @@ class Parser:
         elif self.current_token == RETURN:
             self.eat(RETURN)
             expression = self.expression()
-            return ReturnStmt(expression, self.lexer.line)
+            return ReturnStmt(expression=expression, **self.span(first))
         elif self.current_token == BREAK:
             self.eat(BREAK)
-            return BreakStmt(self.lexer.line)
+            return BreakStmt(**self.span(first))
         elif self.current_token == CONTINUE:
             self.eat(CONTINUE)
-            return ContinueStmt(self.lexer.line)
+            return ContinueStmt(**self.span(first))
         else:
             self.error(f'Expected "if", "for", "while" or "return" statement '
-                       f'but found <{self.current_token}> at line {self.lexer.line}.')
+                       f'but found <{self.current_token}> at line {self.lexer.lines.line(first.start)}.')
 
     def for_statement(self):
+        first = self.current_token
         self.eat(FOR)
         if self.current_token == ID:
             setup = self.declaration()
@@ -175,25 +307,29 @@ class Parser:
             condition=condition,
             increment=increment,
             body=block,
-            line=self.lexer.line,
+            **self.span(first)
         )
 
     def if_statement(self):
+        first = self.current_token
         self.eat(IF)
         condition = self.expression()
         self.eat(COLON)
         true_block = self.block()
         false_block = None
         if self.current_token == ELSE:
+            self.eat(ELSE)
+            self.eat(COLON)
             false_block = self.block()
         return IfStmt(
             condition=condition,
             tbody=true_block,
             fbody=false_block,
-            line=self.lexer.line
+            **self.span(first)
         )
 
     def while_statement(self):
+        first = self.current_token
         self.eat(WHILE)
         condition = self.expression()
         self.eat(COLON)
@@ -202,82 +338,85 @@ class Parser:
         return WhileStmt(
             condition=condition,
             body=block,
-            line=self.lexer.line
+            **self.span(first)
         )
 
     def expression(self):
+        first = self.current_token
         if self.current_token == NOT_OP:
             operator = self.current_token
             self.eat(NOT_OP)
-            return UnOp(operator, self.expression(), self.lexer.line)
+            expression = self.expression()
+            return UnOp(token=operator, expr=expression, prefix=operator, **self.span(first))
         elif self.current_token == SUB_OP:
             operator = self.current_token
             self.eat(SUB_OP)
-            return UnOp(operator, self.expression(), self.lexer.line)
+            expression = self.expression()
+            return UnOp(token=operator, expr=expression, prefix=operator, **self.span(first))
         elif self.current_token == LPAREN:
             self.eat(LPAREN)
             node = self.expression()
             self.eat(RPAREN)
             return node
-        elif self.current_token.type == self.check_assignment_expression():
-            identifier = self.current_token
-            self.eat(ID)
-            operator = self.current_token
-            self.eat(ASSIGN)
-            expression = self.expression()
-            return Assign(identifier, operator, expression, self.lexer.line)
-        elif self.current_token in (ID, FLOAT, INT, CHAR, BOOL, STRING):
-            atom = self.atom_expression()
-            if self.current_token == EOL:
+        elif self.current_token.type in (ID,) + CONSTANTS:
+            if self.current_token == ID and not self.check_function_call():
+                # the name with its indexes is parsed once, `=` after it makes an assignment
+                atom = self.variable()
+                if self.current_token == ASSIGN:
+                    operator = self.current_token
+                    self.eat(ASSIGN)
+                    expression = self.expression()
+                    return Assign(
+                        left=atom,
+                        op=operator,
+                        right=expression,
+                        **self.span(first)
+                    )
+            else:
+                atom = self.atom_expression()
+            if self.current_token not in BIN_OP:
                 return atom
-            if self.current_token in BIN_OP:
-                operator = self.current_token
-                second_atom = self.expression()
-                return BinOp(atom, operator, second_atom, self.lexer.line)
-
-    @restorable
-    def check_assignment_expression(self):
-        if self.current_token.type == ID:
-            self.eat(ID)
-            if self.current_token == ASSIGN:
-                return True
-        return False
+            operator = self.current_token
+            self.eat(operator.type)
+            second_atom = self.expression()
+            return BinOp(
+                left=atom,
+                op=operator,
+                right=second_atom,
+                **self.span(first)
+            )
+        self.error('Expected expression but found <{}> at line {}.'.format(
+            self.current_token.type, self.lexer.lines.line(self.current_token.start)
+        ))
 
     def assignment(self):
-        name = self.current_token
-        self.eat(ID)
+        first = self.current_token
+        name = self.variable()
         operator = self.current_token
         self.eat(ASSIGN)
         value = self.expression()
-        return Assign(name, operator, value, self.lexer.line)
+        return Assign(left=name, op=operator, right=value, **self.span(first))
 
     @restorable
     def check_function_call(self):
         if self.current_token == ID:
             self.eat(ID)
-            self.eat(LPAREN)
-            if self.current_token == RPAREN:
-                return True
-            args = []
-            while self.current_token != RPAREN:
-                args.append(self.expression())
-                self.eat(COMMA)
-            return True
+            return self.current_token == LPAREN
         return False
 
     def function_call(self):
         if self.current_token == ID:
             name = self.current_token
-            line = self.lexer.line
             self.eat(ID)
             self.eat(LPAREN)
-            if self.current_token == RPAREN:
-                return True
             args = []
-            while self.current_token != RPAREN:
+            if self.current_token != RPAREN:
                 args.append(self.expression())
-                self.eat(COMMA)
-            return FunctionCall(name, args, line)
+                while self.current_token == COMMA:
+                    self.eat(COMMA)
+                    args.append(self.expression())
+            self.eat(RPAREN)
+            return FunctionCall(name=name, args=args, **self.span(name))
 
     def atom_expression(self):
         if self.check_function_call():
@@ -288,11 +427,12 @@ class Parser:
 
     def constant(self):
         token = self.current_token
-        if token in (INT, FLOAT, CHAR, STRING, BOOL):
+        if token.type in CONSTANTS:
             self.eat(token.type)
             return Num(
                 token=token,
-                line=self.lexer.line
+                value=token.value,
+                **self.span(token)
             )
         raise Exception()
 
@@ -300,22 +440,52 @@ class Parser:
         token = self.current_token
         if token.type in (CHAR, INT, FLOAT, BOOL, VOID):
             self.eat(token.type)
-            return Type(
+            node = Type(
                 token=token,
-                line=self.lexer.line
+                **self.span(token)
             )
+            # Type '[' NUMBER? ']'
+            while self.current_token == LSQUARE:
+                self.eat(LSQUARE)
+                size = None
+                if self.current_token == INTEGER_CONST:
+                    size = self.current_token.value
+                    self.eat(INTEGER_CONST)
+                self.eat(RSQUARE)
+                node = ArrayType(
+                    element=node,
+                    size=size,
+                    **self.span(token)
+                )
+            return node
+        self.error('Expected type but found <{}> at line {}.'.format(
+            token.type, self.lexer.lines.line(token.start)
+        ))
 
     def variable(self):
+        token = self.current_token
+        self.eat(ID)
         node = Var(
-            token=self.current_token,
-            line=self.lexer.line
+            token=token,
+            **self.span(token)
         )
-        self.eat(ID)
+        # Name '[' Expression ']'
+        while self.current_token == LSQUARE:
+            self.eat(LSQUARE)
+            index = self.expression()
+            self.eat(RSQUARE)
+            node = Index(
+                value=node,
+                index=index,
+                **self.span(token)
+            )
         return node
 
     def empty(self):
         return NoOp(
-            line=self.lexer.line
+            line=self.lexer.lines.line(self.current_token.start),
+            start=self.current_token.start,
+            end=self.current_token.start
         )
 
     def string(self):
@@ -323,7 +493,7 @@ class Parser:
         self.eat(STRING)
         return String(
             token=token,
-            line=self.lexer.line
+            **self.span(token)
         )
 
     def parse(self):
@@ -0,0 +1,343 @@
+""" Compile-time partial evaluation of pure functions
+
+A function is pure when it doesn't assign global names, doesn't call
+`print` and calls only other pure functions. Calls of pure functions
+whose arguments are all constants are evaluated here and replaced with
+the resulting `Num`. Evaluation runs under fuel and recursion limits,
+a call which exceeds them (or reads a global) is left untouched.
+"""
+import math
+import time
+from dataclasses import dataclass, field, fields
+from typing import List
+
+from lexer.keywords import *
+from lexer.lexer_token import Token
+from .tree import *
+from .utils import walk
+
+IMPURE_BUILTINS = ('print',)
+
+
+class _Unsupported(Exception): ...
+
+
+class _Return(Exception):
+    def __init__(self, value):
+        self.value = value
+
+
+class _Break(Exception): ...
+
+
+class _Continue(Exception): ...
+
+
+@dataclass
+class PartialEvalReport:
+    eliminated: int = 0
+    # seconds spent in the pass
+    elapsed: float = 0.0
+    pure_functions: List[str] = field(default_factory=list)
+
+
+def _base_name(node):
+    while isinstance(node, Index):
+        node = node.value
+    return node.token.value if isinstance(node, Var) else None
+
+
+def _locals(function: FunctionDecl):
+    names = {param.var_node.token.value for param in function.params}
+    for node in walk(function.body):
+        if isinstance(node, VarDecl):
+            names.add(_base_name(node.var_node))
+    return names
+
+
+def pure_functions(program: Program):
+    """ Names of pure functions, mutually recursive functions may be pure """
+    functions = {d.func_name: d for d in program.declarations if isinstance(d, FunctionDecl)}
+    calls = {}
+    pure = set()
+    for name, function in functions.items():
+        local_names = _locals(function)
+        calls[name] = set()
+        writes_global = False
+        for node in walk(function.body):
+            if isinstance(node, Assign) and _base_name(node.left) not in local_names:
+                writes_global = True
+            elif isinstance(node, FunctionCall):
+                calls[name].add(node.name.value)
+        if not writes_global:
+            pure.add(name)
+
+    # drop callers of impure functions until nothing changes
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pure):
+            if any(callee not in pure or callee in IMPURE_BUILTINS for callee in calls[name]):
+                pure.discard(name)
+                changed = True
+    return pure
+
+
+def _constant(node):
+    """ Python value of constant node, raise `_Unsupported` otherwise """
+    if not isinstance(node, Num):
+        raise _Unsupported()
+    if node.token.type == TRUE:
+        return True
+    if node.token.type == FALSE:
+        return False
+    if node.token.type in (INTEGER_CONST, FLOAT_CONST, CHAR_CONST):
+        return node.value
+    raise _Unsupported()
+
+
+def _make_constant(value, type_name, call: FunctionCall):
+    """ Constant node of the function return type taking place of the call in the source """
+    if isinstance(value, bool):
+        token = Token(TRUE, 'True') if value else Token(FALSE, 'False')
+    elif type_name == CHAR:
+        token = Token(CHAR_CONST, value)
+    elif isinstance(value, int):
+        token = Token(INTEGER_CONST, value)
+    elif isinstance(value, float):
+        token = Token(FLOAT_CONST, value)
+    else:
+        raise _Unsupported()
+    token.start, token.end = call.start, call.end
+    return Num(token=token, value=token.value, line=call.line, start=call.start, end=call.end)
+
+
+# results which don't fit into the target integers are left to the runtime
+INT_BITS = 64
+INT_MIN, INT_MAX = -2 ** (INT_BITS - 1), 2 ** (INT_BITS - 1) - 1
+CHAR_MAX = 0x10FFFF
+
+
+def _divide(left, right):
+    if right == 0:
+        raise _Unsupported()
+    if isinstance(left, int) and isinstance(right, int):
+        # integer division truncates toward zero
+        quotient = abs(left) // abs(right)
+        return quotient if (left >= 0) == (right >= 0) else -quotient
+    return left / right
+
+
+def _power(base, exponent):
+    if isinstance(exponent, int) and exponent > INT_BITS and abs(base) > 1:
+        raise _Unsupported()
+    return base ** exponent
+
+
+BINARY = {
+    ADD_OP: lambda a, b: a + b,
+    SUB_OP: lambda a, b: a - b,
+    MUL_OP: lambda a, b: a * b,
+    DIV_OP: _divide,
+    MOD_OP: lambda a, b: a - b * _divide(a, b) if isinstance(a, int) and isinstance(b, int) else a % b,
+    POWER_OP: _power,
+    AND_OP: lambda a, b: a and b,
+    OR_OP: lambda a, b: a or b,
+    LT_OP: lambda a, b: a < b,
+    GT_OP: lambda a, b: a > b,
+    LE_OP: lambda a, b: a <= b,
+    GE_OP: lambda a, b: a >= b,
+    EQ_OP: lambda a, b: a == b,
+    NE_OP: lambda a, b: a != b,
+}
+
+
+def _to_int(value, low=INT_MIN, high=INT_MAX):
+    if isinstance(value, float) and not math.isfinite(value):
+        raise _Unsupported()
+    value = int(value)
+    if not low <= value <= high:
+        raise _Unsupported()
+    return value
+
+
+def _to_float(value):
+    value = float(value)
+    # the source has no literals of inf and nan
+    if not math.isfinite(value):
+        raise _Unsupported()
+    return value
+
+
+CASTS = {
+    INT: _to_int,
+    CHAR: lambda value: _to_int(value, 0, CHAR_MAX),
+    FLOAT: _to_float,
+    BOOL: bool,
+}
+
+
+def _cast(type_node):
+    """ Conversion of values to the declared scalar type,
+    which raises `_Unsupported` for values the type can't hold """
+    if not isinstance(type_node, Type) or type_node.token.type not in CASTS:
+        raise _Unsupported()
+    return CASTS[type_node.token.type]
+
+
+class Scope(dict):
+    """ Values of local variables, `casts` keeps conversions to their declared types """
+
+    def __init__(self):
+        super().__init__()
+        self.casts = {}
+
+    def declare(self, name, type_node, value):
+        cast = self.casts[name] = _cast(type_node)
+        self[name] = cast(value)
+
+
+class Evaluator:
+    """ Interpreter of the pure subset of the language """
+
+    def __init__(self, functions, fuel, max_depth):
+        self.functions = functions
+        self.fuel = fuel
+        self.max_depth = max_depth
+        self.depth = 0
+
+    def step(self):
+        self.fuel -= 1
+        if self.fuel < 0:
+            raise _Unsupported()
+
+    def call(self, name, args):
+        function = self.functions.get(name)
+        if function is None or len(function.params) != len(args) or self.depth >= self.max_depth:
+            raise _Unsupported()
+
+        env = Scope()
+        for param, arg in zip(function.params, args):
+            env.declare(param.var_node.token.value, param.type_node, arg)
+        self.depth += 1
+        try:
+            self.block(function.body, env)
+            raise _Unsupported()  # function without return
+        except _Return as result:
+            value = result.value
+        finally:
+            self.depth -= 1
+
+        return _cast(function.type_node)(value)
+
+    def block(self, body, env):
+        for node in body.children:
+            self.statement(node, env)
+
+    def statement(self, node, env):
+        self.step()
+        if isinstance(node, VarDecl):
+            if not isinstance(node.var_node, Var):
+                raise _Unsupported()
+            value = 0 if node.value is None else self.expression(node.value, env)
+            env.declare(node.var_node.token.value, node.type_node, value)
+        elif isinstance(node, ReturnStmt):
+            raise _Return(self.expression(node.expression, env))
+        elif isinstance(node, BreakStmt):
+            raise _Break()
+        elif isinstance(node, ContinueStmt):
+            raise _Continue()
+        elif isinstance(node, IfStmt):
+            if self.expression(node.condition, env):
+                self.block(node.tbody, env)
+            elif node.fbody is not None:
+                self.block(node.fbody, env)
+        elif isinstance(node, WhileStmt):
+            while self.expression(node.condition, env):
+                if self.loop_body(node.body, env):
+                    break
+        elif isinstance(node, ForStmt):
+            self.statement(node.setup, env)
+            while self.expression(node.condition, env):
+                if self.loop_body(node.body, env):
+                    break
+                self.expression(node.increment, env)
+        else:
+            self.expression(node, env)
+
+    def loop_body(self, body, env):
+        """ Run one iteration, returns True on `break` """
+        self.step()
+        try:
+            self.block(body, env)
+        except _Break:
+            return True
+        except _Continue:
+            pass
+        return False
+
+    def expression(self, node, env):
+        self.step()
+        if isinstance(node, Num):
+            return _constant(node)
+        if isinstance(node, Var):
+            if node.token.value not in env:
+                raise _Unsupported()
+            return env[node.token.value]
+        if isinstance(node, Assign):
+            if not isinstance(node.left, Var) or node.left.token.value not in env:
+                raise _Unsupported()
+            name = node.left.token.value
+            value = env[name] = env.casts[name](self.expression(node.right, env))
+            return value
+        if isinstance(node, BinOp):
+            operation = BINARY.get(node.op.type)
+            if operation is None:
+                raise _Unsupported()
+            value = operation(self.expression(node.left, env), self.expression(node.right, env))
+            if isinstance(value, int) and value.bit_length() >= INT_BITS:
+                raise _Unsupported()
+            return value
+        if isinstance(node, UnOp):
+            value = self.expression(node.expr, env)
+            return not value if node.token.type == NOT_OP else -value
+        if isinstance(node, FunctionCall):
+            return self.call(node.name.value, [self.expression(arg, env) for arg in node.args])
+        raise _Unsupported()
+
+
+def partial_evaluate(program: Program, fuel=10000, max_depth=64) -> PartialEvalReport:
+    """ Replace calls of pure functions with constant arguments by their results.
+    `fuel` limits number of evaluated nodes per call and `max_depth` limits recursion. """
+    start = time.perf_counter()
+    report = PartialEvalReport()
+    pure = pure_functions(program)
+    functions = {d.func_name: d for d in program.declarations
+                 if isinstance(d, FunctionDecl) and d.func_name in pure}
+    report.pure_functions = sorted(pure)
+
+    def fold(node):
+        # children first, so nested calls become constants before their parent
+        for f in fields(node):
+            value = getattr(node, f.name)
+            if isinstance(value, Node):
+                setattr(node, f.name, fold(value))
+            elif isinstance(value, list):
+                value[:] = [fold(item) if isinstance(item, Node) else item for item in value]
+
+        if isinstance(node, FunctionCall) and node.name.value in functions:
+            try:
+                args = [_constant(arg) for arg in node.args]
+                function = functions[node.name.value]
+                result = Evaluator(functions, fuel, max_depth).call(function.func_name, args)
+                constant = _make_constant(result, function.type_node.token.type, node)
+            except (_Unsupported, _Return, _Break, _Continue, ArithmeticError, TypeError, ValueError,
+                    RecursionError):
+                return node
+            report.eliminated += 1
+            return constant
+        return node
+
+    fold(program)
+    report.elapsed = time.perf_counter() - start
+    return report
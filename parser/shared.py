@@ -0,0 +1,219 @@
+""" Columnar binary encoding of `parser.tree` nodes for `multiprocessing.shared_memory`
+
+Every node is a row of the nodes table (kind, line, first field, field count).
+Fields are rows of the fields table (name, tag, payload), where payload is
+a node index, list index, token index, scalar or string table index.
+List items are stored in a separate table with the same tag/payload layout.
+"""
+import struct
+from array import array
+from dataclasses import fields
+
+from lexer.shared import INT_MIN, INT_MAX, SharedBlock, StringTable, TokenColumns, TokenColumnsView, StringTableView, TokenView
+from lexer.lexer_token import Token
+from .tree import Node
+
+# tags of the field values, BIG_INT ints are stored as decimal strings
+NONE, NODE, LIST, TOKEN, INT, FLOAT, STR, BOOL, BIG_INT = range(9)
+
+
+class TreeEncoder:
+    """ Flatten tree into columns, nodes are numbered in pre-order """
+
+    def __init__(self):
+        self.strings = StringTable()
+        self.tokens = TokenColumns(self.strings)
+
+        self.kinds = array('I')
+        self.lines = array('q')
+        self.field_start = array('Q')
+        self.field_count = array('I')
+
+        self.field_names = array('I')
+        self.field_tags = array('B')
+        self.field_payload = array('q')
+
+        self.list_start = array('Q')
+        self.list_count = array('I')
+        self.item_tags = array('B')
+        self.item_payload = array('q')
+
+    def node(self, node: Node) -> int:
+        idx = len(self.kinds)
+        values = [(f.name, getattr(node, f.name)) for f in fields(node) if f.name != 'line']
+
+        self.kinds.append(self.strings.add(type(node).__name__))
+        self.lines.append(node.line if isinstance(node.line, int) else -1)
+        self.field_start.append(0)
+        self.field_count.append(len(values))
+
+        # children are encoded first, so fields of a node stay contiguous
+        encoded = [(name, self.value(value)) for name, value in values]
+        self.field_start[idx] = len(self.field_tags)
+        for name, (tag, payload) in encoded:
+            self.field_names.append(self.strings.add(name))
+            self.field_tags.append(tag)
+            self.field_payload.append(payload)
+        return idx
+
+    def value(self, value):
+        if value is None:
+            return NONE, 0
+        if isinstance(value, Node):
+            return NODE, self.node(value)
+        if isinstance(value, Token):
+            return TOKEN, self.tokens.add(value)
+        if isinstance(value, (list, tuple)):
+            return LIST, self.list(value)
+        if isinstance(value, bool):
+            return BOOL, int(value)
+        if isinstance(value, int):
+            if INT_MIN <= value <= INT_MAX:
+                return INT, value
+            return BIG_INT, self.strings.add(str(value))
+        if isinstance(value, float):
+            return FLOAT, struct.unpack('<q', struct.pack('<d', value))[0]
+        return STR, self.strings.add(str(value))
+
+    def list(self, values) -> int:
+        encoded = [self.value(value) for value in values]
+        idx = len(self.list_start)
+        self.list_start.append(len(self.item_tags))
+        self.list_count.append(len(encoded))
+        for tag, payload in encoded:
+            self.item_tags.append(tag)
+            self.item_payload.append(payload)
+        return idx
+
+    def sections(self):
+        return self.strings.sections() + self.tokens.sections() + [
+            self.kinds, self.lines, self.field_start, self.field_count,
+            self.field_names, self.field_tags, self.field_payload,
+            self.list_start, self.list_count, self.item_tags, self.item_payload,
+        ]
+
+
+class TreeBlock(SharedBlock):
+    """ AST in shared memory, `root` is the view of the encoded node """
+    KIND = b'TPYA'
+
+    @classmethod
+    def from_tree(cls, root: Node):
+        encoder = TreeEncoder()
+        encoder.node(root)
+        return cls.create(encoder.sections())
+
+    def setup(self):
+        ends, blob, types, kinds, payload, starts, token_ends, *tables = self.raw
+        self.strings = StringTableView(ends.cast('Q'), blob)
+        self.tokens = TokenColumnsView(self.strings, types, kinds, payload, starts, token_ends)
+
+        (node_kinds, lines, field_start, field_count,
+         field_names, field_tags, field_payload,
+         list_start, list_count, item_tags, item_payload) = tables
+
+        self.kinds = node_kinds.cast('I')
+        self.lines = lines.cast('q')
+        self.field_start = field_start.cast('Q')
+        self.field_count = field_count.cast('I')
+        self.field_names = field_names.cast('I')
+        self.field_tags = field_tags.cast('B')
+        self.field_ints = field_payload.cast('q')
+        self.field_floats = field_payload.cast('d')
+        self.list_start = list_start.cast('Q')
+        self.list_count = list_count.cast('I')
+        self.item_tags = item_tags.cast('B')
+        self.item_ints = item_payload.cast('q')
+        self.item_floats = item_payload.cast('d')
+
+    def views(self):
+        return [self.strings.ends] + self.tokens.views() + [
+            self.kinds, self.lines, self.field_start, self.field_count,
+            self.field_names, self.field_tags, self.field_ints, self.field_floats,
+            self.list_start, self.list_count, self.item_tags, self.item_ints, self.item_floats,
+        ]
+
+    @property
+    def root(self):
+        return NodeView(self, 0)
+
+    def decode(self, tag, ints, floats, idx):
+        if tag == NODE:
+            return NodeView(self, ints[idx])
+        if tag == LIST:
+            return ListView(self, ints[idx])
+        if tag == TOKEN:
+            return TokenView(self.tokens, ints[idx])
+        if tag == INT:
+            return ints[idx]
+        if tag == STR:
+            return self.strings[ints[idx]]
+        if tag == FLOAT:
+            return floats[idx]
+        if tag == BOOL:
+            return bool(ints[idx])
+        if tag == BIG_INT:
+            return int(self.strings[ints[idx]])
+        return None
+
+    def __len__(self):
+        return len(self.kinds)
+
+
+class NodeView:
+    """ Read-only view of an encoded node, fields are decoded on access """
+    __slots__ = ('block', 'index')
+
+    def __init__(self, block: TreeBlock, index: int):
+        self.block = block
+        self.index = index
+
+    @property
+    def kind(self):
+        """ Name of the `parser.tree` class of the node """
+        return self.block.strings[self.block.kinds[self.index]]
+
+    @property
+    def line(self):
+        return self.block.lines[self.index]
+
+    @property
+    def fields(self):
+        block = self.block
+        start = block.field_start[self.index]
+        return [block.strings[block.field_names[i]]
+                for i in range(start, start + block.field_count[self.index])]
+
+    def __getattr__(self, name):
+        block = self.block
+        start = block.field_start[self.index]
+        for i in range(start, start + block.field_count[self.index]):
+            if block.strings[block.field_names[i]] == name:
+                return block.decode(block.field_tags[i], block.field_ints, block.field_floats, i)
+        raise AttributeError('{} node has no field {}'.format(self.kind, name))
+
+    def __repr__(self):
+        return '{}View(index={}, line={})'.format(self.kind, self.index, self.line)
+
+
+class ListView:
+    """ Read-only view of an encoded list field """
+    __slots__ = ('block', 'index')
+
+    def __init__(self, block: TreeBlock, index: int):
+        self.block = block
+        self.index = index
+
+    def __len__(self):
+        return self.block.list_count[self.index]
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < len(self):
+            raise IndexError('List index {} out of range'.format(idx))
+        block = self.block
+        item = block.list_start[self.index] + idx
+        return block.decode(block.item_tags[item], block.item_ints, block.item_floats, item)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
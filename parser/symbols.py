@@ -0,0 +1,227 @@
+""" Persistent cross-file index of symbols and call graph
+
+Function signatures, top-level variables and call edges of `.tpy` files are
+stored in SQLite. Files are re-parsed only when their size/mtime changed and
+their content hash differs, queries never touch the parser.
+"""
+import hashlib
+import os
+import sqlite3
+from dataclasses import dataclass
+from typing import List, Optional
+
+from lexer.lexer import Lexer
+from .parser import Parser
+from .tree import *
+from .utils import walk
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS functions (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    params TEXT NOT NULL,
+    return_type TEXT,
+    line INTEGER
+);
+CREATE TABLE IF NOT EXISTS variables (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    type TEXT,
+    line INTEGER
+);
+CREATE TABLE IF NOT EXISTS calls (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    caller TEXT NOT NULL,
+    callee TEXT NOT NULL,
+    line INTEGER
+);
+CREATE INDEX IF NOT EXISTS functions_name ON functions(name);
+CREATE INDEX IF NOT EXISTS variables_name ON variables(name);
+CREATE INDEX IF NOT EXISTS calls_callee ON calls(callee);
+CREATE INDEX IF NOT EXISTS calls_caller ON calls(caller);
+"""
+
+# caller name of the calls made outside of any function
+MODULE = '<module>'
+
+
+@dataclass
+class Location:
+    path: str
+    name: str
+    line: Optional[int]
+    # signature of definition or name of the caller for references
+    detail: Optional[str] = None
+
+
+def type_name(node):
+    if isinstance(node, ArrayType):
+        return '{}[{}]'.format(type_name(node.element), '' if node.size is None else node.size)
+    if isinstance(node, Type):
+        return node.token.value
+    return None
+
+
+def _line(node):
+    return node.line if isinstance(node.line, int) else None
+
+
+class SymbolIndex:
+    """ On-disk index of declarations and call edges
+
+    >>> with SymbolIndex('symbols.db') as index:
+    ...     index.update_directory('src')
+    ...     index.callers('square', transitive=True)
+    """
+
+    def __init__(self, path=':memory:'):
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def update(self, paths) -> int:
+        """ Index changed files, returns number of re-parsed files """
+        parsed = 0
+        with self.db:
+            for path in paths:
+                parsed += self._update_file(os.path.abspath(path))
+        return parsed
+
+    def update_directory(self, root, extension='.tpy') -> int:
+        """ Index all files under `root` and forget the deleted ones """
+        root = os.path.abspath(root)
+        paths = []
+        for directory, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(directory, name)
+                if name.endswith(extension) and os.path.isfile(path):
+                    paths.append(path)
+
+        parsed = self.update(paths)
+        existing = set(paths)
+        with self.db:
+            for file_id, path in self.db.execute('SELECT id, path FROM files').fetchall():
+                if path.startswith(root + os.sep) and path not in existing:
+                    self.db.execute('DELETE FROM files WHERE id = ?', (file_id,))
+        return parsed
+
+    def remove(self, path):
+        with self.db:
+            self.db.execute('DELETE FROM files WHERE path = ?', (os.path.abspath(path),))
+
+    def _update_file(self, path):
+        if not os.path.isfile(path):
+            return 0
+        stat = os.stat(path)
+        row = self.db.execute('SELECT id, mtime, size, hash FROM files WHERE path = ?', (path,)).fetchone()
+        if row and row[1] == stat.st_mtime_ns and row[2] == stat.st_size:
+            return 0
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha1(content).hexdigest()
+        if row and row[3] == digest:
+            self.db.execute('UPDATE files SET mtime = ?, size = ? WHERE id = ?', (stat.st_mtime_ns, stat.st_size, row[0]))
+            return 0
+
+        if row:
+            self.db.execute('DELETE FROM files WHERE id = ?', (row[0],))
+        try:
+            program = Parser(Lexer(content.decode('utf-8'))).parse()
+            error = None
+        except Exception as e:
+            # any failure (including RecursionError on deeply nested input)
+            # is recorded, so it doesn't roll back the whole batch
+            program, error = None, '{}: {}'.format(type(e).__name__, e)
+
+        file_id = self.db.execute(
+            'INSERT INTO files (path, mtime, size, hash, error) VALUES (?, ?, ?, ?, ?)',
+            (path, stat.st_mtime_ns, stat.st_size, digest, error)
+        ).lastrowid
+        if program is not None:
+            self._index_program(file_id, program)
+        return 1
+
+    def _index_program(self, file_id, program: Program):
+        for declaration in program.declarations:
+            if isinstance(declaration, FunctionDecl):
+                params = ', '.join('{}: {}'.format(p.var_node.token.value, type_name(p.type_node))
+                                   for p in declaration.params)
+                self.db.execute(
+                    'INSERT INTO functions (file_id, name, params, return_type, line) VALUES (?, ?, ?, ?, ?)',
+                    (file_id, declaration.func_name, params, type_name(declaration.type_node), _line(declaration))
+                )
+                caller = declaration.func_name
+                nodes = walk(declaration.body)
+            else:
+                self.db.execute(
+                    'INSERT INTO variables (file_id, name, type, line) VALUES (?, ?, ?, ?)',
+                    (file_id, declaration.var_node.token.value, type_name(declaration.type_node), _line(declaration))
+                )
+                caller = MODULE
+                nodes = walk(declaration.value)
+
+            self.db.executemany(
+                'INSERT INTO calls (file_id, caller, callee, line) VALUES (?, ?, ?, ?)',
+                [(file_id, caller, node.name.value, _line(node))
+                 for node in nodes if isinstance(node, FunctionCall)]
+            )
+
+    def definitions(self, name) -> List[Location]:
+        """ Functions and top-level variables declared with the name """
+        rows = self.db.execute(
+            'SELECT path, name, line, name || \'(\' || params || \') -> \' || IFNULL(return_type, \'?\') '
+            'FROM functions JOIN files ON files.id = file_id WHERE name = ? '
+            'UNION ALL '
+            'SELECT path, name, line, name || \': \' || IFNULL(type, \'?\') '
+            'FROM variables JOIN files ON files.id = file_id WHERE name = ? '
+            'ORDER BY 1, 3',
+            (name, name)
+        )
+        return [Location(*row) for row in rows]
+
+    def references(self, name) -> List[Location]:
+        """ Call sites of the function, `detail` is the calling function """
+        rows = self.db.execute(
+            'SELECT path, callee, line, caller FROM calls JOIN files ON files.id = file_id '
+            'WHERE callee = ? ORDER BY 1, 3',
+            (name,)
+        )
+        return [Location(*row) for row in rows]
+
+    def callers(self, name, transitive=False) -> List[str]:
+        """ Names of the functions calling `name` directly or, if `transitive`, through other functions """
+        if not transitive:
+            rows = self.db.execute('SELECT DISTINCT caller FROM calls WHERE callee = ? ORDER BY 1', (name,))
+        else:
+            rows = self.db.execute(
+                'WITH RECURSIVE callers(name) AS ('
+                '    SELECT caller FROM calls WHERE callee = ? '
+                '    UNION '
+                '    SELECT calls.caller FROM calls JOIN callers ON calls.callee = callers.name'
+                ') SELECT name FROM callers ORDER BY 1',
+                (name,)
+            )
+        return [row[0] for row in rows]
+
+    def errors(self) -> List[Location]:
+        """ Files which failed to parse """
+        rows = self.db.execute('SELECT path, \'\', NULL, error FROM files WHERE error IS NOT NULL ORDER BY 1')
+        return [Location(*row) for row in rows]
@@ -1,6 +1,6 @@
 from typing import Union, List
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from lexer.lexer_token import Token
 
@@ -8,6 +8,9 @@ from lexer.lexer_token import Token
 @dataclass
 class Node:
     line: int
+    # offsets of the first and past-the-last char of the node in the source
+    start: int = field(default=None, kw_only=True)
+    end: int = field(default=None, kw_only=True)
 
 
 @dataclass
@@ -30,11 +33,26 @@ class Type(Node):
     token: Token
 
 
+@dataclass
+class ArrayType(Node):
+    element: Node
+    # None for dynamic arrays
+    size: int = None
+
+
 @dataclass
 class Var(Node):
     token: Token
 
 
+@dataclass
+class Index(Node):
+    value: Node
+    index: Node
+    # set when the index is proven to be in bounds at compile time
+    checked: bool = False
+
+
 @dataclass
 class BinOp(Node):
     left: Node
@@ -51,8 +69,9 @@ class UnOp(Node):
 
 @dataclass
 class Assign(Node):
-    left: Token
-    token: Token
+    left: Node
+    op: Token
+    right: Node
 
 
 @dataclass
@@ -1,15 +1,36 @@
-import pickle
+from dataclasses import fields
 from functools import wraps
 
+from .tree import Node
+
 
 def restorable(fn):
-    """ Decorator reset object state after calling function """
+    """ Decorator reset object state after calling function.
+    Attributes of the object and of its `lexer` are copied shallowly,
+    so the function may rebind them but must not mutate their values. """
 
     @wraps(fn)
     def wrapper(self, *args, **kwargs):
-        state = pickle.dumps(self.__dict__)
-        result = fn(self, *args, **kwargs)
-        self.__dict__ = pickle.loads(state)
-        return result
+        state = dict(self.__dict__)
+        lexer_state = dict(self.lexer.__dict__)
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            self.__dict__ = state
+            self.lexer.__dict__ = lexer_state
 
     return wrapper
+
+
+def walk(node):
+    """ Yield node and all its descendants in pre-order """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (list, tuple)):
+            stack.extend(reversed(node))
+            continue
+        if not isinstance(node, Node):
+            continue
+        yield node
+        stack.extend(reversed([getattr(node, f.name) for f in fields(node)]))
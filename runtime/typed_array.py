@@ -0,0 +1,83 @@
+""" Runtime representation of array values
+
+Elements are kept unboxed in a contiguous `array.array` buffer, so arrays
+with millions of elements cost only their item size per element.
+"""
+from array import array
+
+from lexer.keywords import INT, FLOAT, CHAR, BOOL
+from parser.tree import ArrayType
+
+# chars are stored as their code points
+TYPECODES = {
+    INT: 'q',
+    FLOAT: 'd',
+    CHAR: 'I',
+    BOOL: 'B',
+}
+
+
+class ArrayIndexError(Exception): ...
+
+
+class TypedArray:
+    """ Fixed-size or dynamic array of `int`, `float`, `char` or `bool` """
+    __slots__ = ('element', 'data', 'fixed')
+
+    def __init__(self, element: str, size: int = 0, fixed: bool = False):
+        if element not in TYPECODES:
+            raise TypeError('Arrays of <{}> are not supported'.format(element))
+        self.element = element
+        self.fixed = fixed
+        # repeating a one item array fills the buffer without boxing every element
+        self.data = array(TYPECODES[element], [0]) * size
+
+    @classmethod
+    def from_type(cls, type_node: ArrayType, size: int = 0):
+        """ Allocate array described by the type node, `size` is the
+        initial length of a dynamic array """
+        element = type_node.element
+        if isinstance(element, ArrayType):
+            raise TypeError('Only one-dimensional arrays are supported at line {}'.format(type_node.line))
+        if type_node.size is not None:
+            return cls(element.token.type, type_node.size, fixed=True)
+        return cls(element.token.type, size)
+
+    def _check(self, index):
+        if not 0 <= index < len(self.data):
+            raise ArrayIndexError('Index {} out of range for array of size {}'.format(index, len(self.data)))
+
+    def get(self, index):
+        self._check(index)
+        return self.get_unchecked(index)
+
+    def set(self, index, value):
+        self._check(index)
+        self.set_unchecked(index, value)
+
+    def get_unchecked(self, index):
+        """ Load element whose index was checked at compile time """
+        value = self.data[index]
+        if self.element == BOOL:
+            return bool(value)
+        return value
+
+    def set_unchecked(self, index, value):
+        """ Store element whose index was checked at compile time """
+        self.data[index] = value
+
+    def append(self, value):
+        if self.fixed:
+            raise ArrayIndexError('Can not append to fixed-size array')
+        self.data.append(value)
+
+    @property
+    def buffer(self):
+        """ Raw contiguous storage of the elements """
+        return memoryview(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return 'TypedArray({}, size={})'.format(self.element, len(self.data))
@@ -0,0 +1,82 @@
+from lexer.keywords import *
+from lexer.lexer import Lexer
+from parser.parser import Parser
+from parser.partial_eval import partial_evaluate
+from parser.tree import *
+
+SOURCE = '''
+def nan() -> int: begin
+    a: float = 10.0
+    while a < a * 2.0: begin
+        a = a * a
+    end
+    a = a - a
+    return a
+end
+
+def huge() -> int: begin
+    a: float = 10.0
+    for i: int = 0; i < 7; i = i + 1 begin
+        a = a * a
+    end
+    return a
+end
+
+def infinite() -> float: begin
+    a: float = 10.0
+    while a < a * 2.0: begin
+        a = a * a
+    end
+    return a
+end
+
+def letter(n: int) -> char: begin
+    return n
+end
+
+def truncate(x: float) -> int: begin
+    return x
+end
+
+def main() -> int: begin
+    a: int = nan()
+    b: int = huge()
+    c: float = infinite()
+    d: char = letter(65)
+    e: char = letter(-1)
+    f: int = truncate(2.5)
+end
+'''
+
+
+def folded():
+    program = Parser(Lexer(SOURCE)).parse()
+    partial_evaluate(program)
+    main = program.declarations[-1]
+    return {node.var_node.token.value: node.value for node in main.body.children}
+
+
+def test_nan_is_not_folded():
+    assert isinstance(folded()['a'], FunctionCall)
+
+
+def test_int_overflow_is_not_folded():
+    assert isinstance(folded()['b'], FunctionCall)
+
+
+def test_infinity_is_not_folded():
+    assert isinstance(folded()['c'], FunctionCall)
+
+
+def test_char_in_range_is_folded():
+    value = folded()['d']
+    assert isinstance(value, Num) and value.token.type == CHAR_CONST and value.value == 65
+
+
+def test_char_out_of_range_is_not_folded():
+    assert isinstance(folded()['e'], FunctionCall)
+
+
+def test_float_is_truncated_to_int():
+    value = folded()['f']
+    assert isinstance(value, Num) and value.token.type == INTEGER_CONST and value.value == 2